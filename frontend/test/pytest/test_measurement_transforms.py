@@ -18,7 +18,9 @@ import os
 
 # pylint: disable=unused-argument
 import platform
+import re
 import tempfile
+from copy import deepcopy
 from functools import partial
 from unittest.mock import Mock, patch
 
@@ -40,6 +42,16 @@ from catalyst.tracing.contexts import EvaluationContext, EvaluationMode
 
 # pylint: disable=attribute-defined-outside-init
 
+# measurements that readout transforms must eliminate from the compiled IR:
+DIAGONALIZED_MEASUREMENTS_RE = re.compile(r"expval|quantum\.var|probs")
+
+# Borrowing the NullQubit library for the custom devices below:
+NULL_QUBIT_LIB_PATH = (
+    get_lib_path("runtime", "RUNTIME_LIB_DIR")
+    + "/librtd_null_qubit"
+    + (".dylib" if platform.system() == "Darwin" else ".so")
+)
+
 
 class CustomDevice(Device):
     """A Custom Device following the new API."""
@@ -57,12 +69,7 @@ class CustomDevice(Device):
         """Returns a tuple consisting of the device name, and
         the location to the shared object with the C/C++ device implementation.
         """
-        system_extension = ".dylib" if platform.system() == "Darwin" else ".so"
-        # Borrowing the NullQubit library:
-        lib_path = (
-            get_lib_path("runtime", "RUNTIME_LIB_DIR") + "/librtd_null_qubit" + system_extension
-        )
-        return "CustomQubit", lib_path
+        return "CustomQubit", NULL_QUBIT_LIB_PATH
 
     def execute(self, circuits, execution_config):
         """Execution."""
@@ -86,12 +93,7 @@ class CustomDeviceLimitedMPs(Device):
         the location to the shared object with the C/C++ device implementation.
         """
 
-        system_extension = ".dylib" if platform.system() == "Darwin" else ".so"
-        # Borrowing the NullQubit library:
-        lib_path = (
-            get_lib_path("runtime", "RUNTIME_LIB_DIR") + "/librtd_null_qubit" + system_extension
-        )
-        return "CustomDevice", lib_path
+        return "CustomDevice", NULL_QUBIT_LIB_PATH
 
     def execute(self, circuits, execution_config):
         """Execution."""
@@ -100,25 +102,20 @@ class CustomDeviceLimitedMPs(Device):
     def __enter__(self, *args, **kwargs):
         toml_file_path = self.config_filepath
         with open(toml_file_path, mode="r", encoding="UTF-8") as f:
-            toml_contents = f.readlines()
-
-        updated_toml_contents = []
-        for line in toml_contents:
-            if "ExpectationMP" in line:
-                continue
-            if "VarianceMP" in line:
-                continue
-            if "ProbabilityMP" in line:
-                continue
-            if "SampleMP" in line and not self.allow_samples:
-                continue
-            if "CountsMP" in line and not self.allow_counts:
-                continue
-
-            updated_toml_contents.append(line)
+            toml_contents = f.read()
+
+        removed_mps = ["ExpectationMP", "VarianceMP", "ProbabilityMP"]
+        if not self.allow_samples:
+            removed_mps.append("SampleMP")
+        if not self.allow_counts:
+            removed_mps.append("CountsMP")
+
+        # drop every line mentioning an unsupported measurement process in one pass
+        removed_lines = re.compile(rf".*(?:{'|'.join(removed_mps)}).*\n?", re.MULTILINE)
+        updated_toml_contents = removed_lines.sub("", toml_contents)
 
         self.toml_file = tempfile.NamedTemporaryFile(mode="w", delete=False)
-        self.toml_file.writelines(updated_toml_contents)
+        self.toml_file.write(updated_toml_contents)
         self.toml_file.close()  # close for now without deleting
 
         self.config_filepath = self.toml_file.name
@@ -129,6 +126,47 @@ class CustomDeviceLimitedMPs(Device):
         self.config_filepath = None
 
 
+# Single-measurement cases for the _analytic tests below, with the expected results
+# precomputed once at collection time rather than rebuilt for every parametrized run.
+# pylint: disable=unnecessary-lambda
+ANALYTIC_THETA = 2.5
+SINGLE_MEASUREMENT_ANALYTIC_CASES = [
+    pytest.param(
+        lambda: qml.expval(qml.PauliY(wires=0) @ qml.PauliY(wires=1)),
+        np.sin(ANALYTIC_THETA) * np.sin(ANALYTIC_THETA / 2),
+        id="expval",
+    ),
+    pytest.param(
+        lambda: qml.var(qml.Y(wires=1)),
+        1 - np.sin(ANALYTIC_THETA / 2) ** 2,
+        id="var",
+    ),
+    pytest.param(
+        lambda: qml.probs(),
+        np.einsum(
+            "i,j,k->ijk",
+            [np.cos(ANALYTIC_THETA / 2) ** 2, np.sin(ANALYTIC_THETA / 2) ** 2],
+            [np.cos(ANALYTIC_THETA / 4) ** 2, np.sin(ANALYTIC_THETA / 4) ** 2],
+            [1, 0, 0, 0],
+        ).ravel(),
+        id="probs",
+    ),
+    pytest.param(
+        lambda: qml.probs(wires=[1]),
+        np.array([np.cos(ANALYTIC_THETA / 4) ** 2, np.sin(ANALYTIC_THETA / 4) ** 2]),
+        id="probs_single_wire",
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def custom_device_capabilities():
+    """A shared CustomDevice and its parsed capabilities, so tests don't re-read
+    the device TOML on every invocation."""
+    dev = CustomDevice(wires=4, shots=1000)
+    return dev, get_device_capabilities(dev)
+
+
 class TestMeasurementTransforms:
     """Tests for transforms modifying measurements"""
 
@@ -151,15 +189,15 @@ class TestMeasurementTransforms:
                 qml.probs(wires=[3]),
             )
 
-        transformed_circuit = measurements_from_counts(basic_circuit, dev.wires)
+        transformed_circuit = qml.qjit(measurements_from_counts(basic_circuit, dev.wires), seed=37)
 
-        mlir = qml.qjit(transformed_circuit, target="mlir").mlir
+        mlir = transformed_circuit.mlir
         assert "expval" not in mlir
         assert "quantum.var" not in mlir
         assert "counts" in mlir
 
         theta = 1.9
-        expval_res, var_res, counts_res, probs_res = qml.qjit(transformed_circuit, seed=37)(theta)
+        expval_res, var_res, counts_res, probs_res = transformed_circuit(theta)
 
         expval_expected = np.sin(theta) * np.sin(theta / 2)
         var_expected = 1 - np.sin(2 * theta) ** 2
@@ -172,14 +210,14 @@ class TestMeasurementTransforms:
 
         # counts comparison by converting catalyst format to PL style eigvals dict
         basis_states, counts = counts_res
-        num_excitations_per_state = [
-            sum(int(i) for i in format(int(state), "01b")) for state in basis_states
-        ]
-        eigvals = [(-1) ** i for i in num_excitations_per_state]
-        eigval_counts_res = {
-            -1.0: sum(count for count, eigval in zip(counts, eigvals) if eigval == -1),
-            1.0: sum(count for count, eigval in zip(counts, eigvals) if eigval == 1),
-        }
+        states = np.asarray(basis_states, dtype=np.uint64)
+        num_excitations_per_state = (
+            np.unpackbits(states.view(np.uint8)).reshape(len(states), -1).sum(axis=1)
+        )
+        # states with an odd number of excitations have eigenvalue -1, even ones +1
+        parity = num_excitations_per_state % 2
+        totals = np.bincount(parity, weights=np.asarray(counts), minlength=2)
+        eigval_counts_res = {-1.0: totals[1], 1.0: totals[0]}
 
         # +/- 200 shots is pretty reasonable with 5000 shots total
         assert np.isclose(eigval_counts_res[-1], counts_expected[-1], atol=200)
@@ -204,16 +242,16 @@ class TestMeasurementTransforms:
                 qml.probs(wires=[3]),
             )
 
-        transformed_circuit = measurements_from_samples(basic_circuit, dev.wires)
+        transformed_circuit = qml.qjit(measurements_from_samples(basic_circuit, dev.wires), seed=37)
 
-        mlir = qml.qjit(transformed_circuit, target="mlir").mlir
+        mlir = transformed_circuit.mlir
         assert "expval" not in mlir
         assert "quantum.var" not in mlir
         assert "sample" in mlir
 
         theta = 1.9
 
-        expval_res, var_res, sample_res, probs_res = qml.qjit(transformed_circuit, seed=37)(theta)
+        expval_res, var_res, sample_res, probs_res = transformed_circuit(theta)
 
         expval_expected = np.sin(theta) * np.sin(theta / 2)
         var_expected = 1 - np.sin(2 * theta) ** 2
@@ -227,7 +265,7 @@ class TestMeasurementTransforms:
         # sample comparison
         assert np.isclose(np.mean(sample_res), np.mean(sample_expected), atol=0.05)
         assert len(sample_res) == len(sample_expected)
-        assert set(np.array(sample_res)) == set(sample_expected)
+        assert np.array_equal(np.unique(sample_res), np.unique(sample_expected))
 
     @pytest.mark.parametrize(
         "unsupported_measurement, measurement_transform, target_measurement",
@@ -278,11 +316,9 @@ class TestMeasurementTransforms:
                     qml.probs(wires=[3, 4]),
                 )
 
-            mlir = qml.qjit(circuit, target="mlir").mlir
+            mlir = circuit.mlir
 
-        assert "expval" not in mlir
-        assert "quantum.var" not in mlir
-        assert "probs" not in mlir
+        assert not DIAGONALIZED_MEASUREMENTS_RE.search(mlir)
         assert target_measurement in mlir
 
     @pytest.mark.parametrize(
@@ -330,11 +366,9 @@ class TestMeasurementTransforms:
                     qml.probs(wires=[3, 4]),
                 )
 
-            mlir = qml.qjit(circuit, target="mlir").mlir
+            mlir = circuit.mlir
 
-        assert "expval" not in mlir
-        assert "quantum.var" not in mlir
-        assert "probs" not in mlir
+        assert not DIAGONALIZED_MEASUREMENTS_RE.search(mlir)
         assert target_measurement in mlir
 
     def test_error_is_raised_if_no_observables_and_no_samples_or_counts(self, mocker):
@@ -391,14 +425,14 @@ class TestMeasurementTransforms:
         basis_states, counts = res
 
         if measurement().obs:
-            num_excitations_per_state = [
-                sum(int(i) for i in format(int(state), "01b")) for state in basis_states
-            ]
-            eigvals = [(-1) ** i for i in num_excitations_per_state]
-            eigval_counts_res = {
-                -1.0: sum(count for count, eigval in zip(counts, eigvals) if eigval == -1),
-                1.0: sum(count for count, eigval in zip(counts, eigvals) if eigval == 1),
-            }
+            states = np.asarray(basis_states, dtype=np.uint64)
+            num_excitations_per_state = (
+                np.unpackbits(states.view(np.uint8)).reshape(len(states), -1).sum(axis=1)
+            )
+            # states with an odd number of excitations have eigenvalue -1, even ones +1
+            parity = num_excitations_per_state % 2
+            totals = np.bincount(parity, weights=np.asarray(counts), minlength=2)
+            eigval_counts_res = {-1.0: totals[1], 1.0: totals[0]}
 
             # +/- 100 shots is pretty reasonable with 3000 shots total
             assert np.isclose(eigval_counts_res[-1], counts_expected[-1], atol=100)
@@ -406,9 +440,12 @@ class TestMeasurementTransforms:
 
         else:
             num_wires = len(measurement().wires) if measurement().wires else len(dev.wires)
-            basis_states = [format(int(state), "01b").zfill(num_wires) for state in basis_states]
-            counts = [int(c) for c in counts]
-            counts_dict = dict((state, c) for (state, c) in zip(basis_states, counts) if c != 0)
+            states = np.asarray(basis_states, dtype=np.int64)
+            bits = (states[:, None] >> np.arange(num_wires - 1, -1, -1)) & 1
+            basis_states = (bits.astype(np.uint8) + ord("0")).view(f"S{num_wires}").ravel()
+            counts = np.asarray(counts, dtype=int)
+            nonzero = counts != 0
+            counts_dict = dict(zip(basis_states[nonzero].astype(str), counts[nonzero].tolist()))
 
             for res, expected_res in zip(counts_dict.items(), counts_expected.items()):
                 assert res[0] == expected_res[0]
@@ -447,31 +484,7 @@ class TestMeasurementTransforms:
         assert res.shape == samples_expected.shape
         assert np.allclose(np.mean(res, axis=0), np.mean(samples_expected, axis=0), atol=0.05)
 
-    # pylint: disable=unnecessary-lambda
-    @pytest.mark.parametrize(
-        "input_measurement, expected_res",
-        [
-            (
-                lambda: qml.expval(qml.PauliY(wires=0) @ qml.PauliY(wires=1)),
-                lambda theta: np.sin(theta) * np.sin(theta / 2),
-            ),
-            (lambda: qml.var(qml.Y(wires=1)), lambda theta: 1 - np.sin(theta / 2) ** 2),
-            (
-                lambda: qml.probs(),
-                lambda theta: np.outer(
-                    np.outer(
-                        [np.cos(theta / 2) ** 2, np.sin(theta / 2) ** 2],
-                        [np.cos(theta / 4) ** 2, np.sin(theta / 4) ** 2],
-                    ),
-                    [1, 0, 0, 0],
-                ).flatten(),
-            ),
-            (
-                lambda: qml.probs(wires=[1]),
-                lambda theta: [np.cos(theta / 4) ** 2, np.sin(theta / 4) ** 2],
-            ),
-        ],
-    )
+    @pytest.mark.parametrize("input_measurement, expected_res", SINGLE_MEASUREMENT_ANALYTIC_CASES)
     @pytest.mark.parametrize("shots", [3000, (3000, 4000), (3000, 3500, 4000)])
     def test_measurement_from_samples_single_measurement_analytic(
         self,
@@ -493,43 +506,18 @@ class TestMeasurementTransforms:
             qml.RX(theta / 2, 1)
             return input_measurement()
 
-        mlir = qml.qjit(circuit, target="mlir").mlir
+        mlir = circuit.mlir
         assert "expval" not in mlir
         assert "sample" in mlir
 
-        theta = 2.5
-        res = circuit(theta)
+        res = circuit(ANALYTIC_THETA)
 
         if len(dev.shots.shot_vector) != 1:
             assert len(res) == len(dev.shots.shot_vector)
 
-        assert np.allclose(res, expected_res(theta), atol=0.05)
+        assert np.allclose(res, expected_res, atol=0.05)
 
-    # pylint: disable=unnecessary-lambda
-    @pytest.mark.parametrize(
-        "input_measurement, expected_res",
-        [
-            (
-                lambda: qml.expval(qml.PauliY(wires=0) @ qml.PauliY(wires=1)),
-                lambda theta: np.sin(theta) * np.sin(theta / 2),
-            ),
-            (lambda: qml.var(qml.Y(wires=1)), lambda theta: 1 - np.sin(theta / 2) ** 2),
-            (
-                lambda: qml.probs(),
-                lambda theta: np.outer(
-                    np.outer(
-                        [np.cos(theta / 2) ** 2, np.sin(theta / 2) ** 2],
-                        [np.cos(theta / 4) ** 2, np.sin(theta / 4) ** 2],
-                    ),
-                    [1, 0, 0, 0],
-                ).flatten(),
-            ),
-            (
-                lambda: qml.probs(wires=[1]),
-                lambda theta: [np.cos(theta / 4) ** 2, np.sin(theta / 4) ** 2],
-            ),
-        ],
-    )
+    @pytest.mark.parametrize("input_measurement, expected_res", SINGLE_MEASUREMENT_ANALYTIC_CASES)
     def test_measurement_from_counts_single_measurement_analytic(
         self, input_measurement, expected_res
     ):
@@ -547,17 +535,16 @@ class TestMeasurementTransforms:
             qml.RX(theta / 2, 1)
             return input_measurement()
 
-        mlir = qml.qjit(circuit, target="mlir").mlir
+        mlir = circuit.mlir
         assert "expval" not in mlir
         assert "counts" in mlir
 
-        theta = 2.5
-        res = circuit(theta)
+        res = circuit(ANALYTIC_THETA)
 
         if len(dev.shots.shot_vector) != 1:
             assert len(res) == len(dev.shots.shot_vector)
 
-        assert np.allclose(res, expected_res(theta), atol=0.05)
+        assert np.allclose(res, expected_res, atol=0.05)
 
     def test_measurement_from_counts_raises_not_implemented(self):
         """Test that an measurement not supported by the measurements_from_counts or
@@ -737,29 +724,34 @@ class TestMeasurementTransforms:
 
         assert split_non_commuting in transform_program
 
-    def test_measurements_are_split(self, mocker):
+    def test_measurements_are_split(self, custom_device_capabilities, mocker):
         """Test that the split_to_single_terms or split_non_commuting transform
         are added to the transform program from preprocess as expected, based on the
         sum_observables_flag and the non_commuting_observables_flag"""
 
-        dev = CustomDevice(wires=4, shots=1000)
+        # the device capabilities are parsed once per module; each QJITDevice gets its own copy
+        dev, config = custom_device_capabilities
+        with patch(
+            "catalyst.device.qjit_device.get_device_capabilities",
+            Mock(side_effect=lambda *_: deepcopy(config)),
+        ):
+            qjit_dev1 = QJITDevice(dev)
+            qjit_dev2 = QJITDevice(dev)
+            qjit_dev3 = QJITDevice(dev)
+            qjit_dev4 = QJITDevice(dev)
 
         # dev1 supports non-commuting observables and sum observables - no splitting
-        qjit_dev1 = QJITDevice(dev)
         assert "Sum" in qjit_dev1.capabilities.observables
         assert qjit_dev1.capabilities.non_commuting_observables is True
 
         # dev2 supports non-commuting observables but NOT sums - split_to_single_terms
-        qjit_dev2 = QJITDevice(dev)
         del qjit_dev2.capabilities.observables["Sum"]
 
         # dev3 supports does not support non-commuting observables OR sums - split_non_commuting
-        qjit_dev3 = QJITDevice(dev)
         del qjit_dev3.capabilities.observables["Sum"]
         qjit_dev3.capabilities.non_commuting_observables = False
 
         # dev4 supports sums but NOT non-commuting observables - split_non_commuting
-        qjit_dev4 = QJITDevice(dev)
         qjit_dev4.capabilities.non_commuting_observables = False
 
         # Check the preprocess